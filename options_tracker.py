@@ -1,10 +1,126 @@
 import os
+import numpy as np
 import pandas as pd
+import threading
 import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from numba import njit
 from polygon import RESTClient  
 from dotenv import load_dotenv
 
+def ewma_alpha(span):
+    """
+    Smoothing factor for a span, derived the same way pandas does (via center of mass)
+    """
+    com = (span - 1) / 2.0
+    return 1.0 / (1.0 + com)
+
+# Smoothing factors are fixed, numba freezes these into compute_indicators at compile time
+ALPHA_7 = ewma_alpha(7)
+ALPHA_17 = ewma_alpha(17)
+ALPHA_12 = ewma_alpha(12)
+ALPHA_26 = ewma_alpha(26)
+ALPHA_9 = ewma_alpha(9)
+
+@njit(cache=True)
+def ewma_step(weighted, old_wt, cur, alpha):
+    """
+    One step of the adjust=False EWMA recurrence, returns the updated (weighted, old_wt)
+    """
+    # Same update order as pandas so results match bit for bit
+    if weighted == weighted:
+        # Missing values still decay the previous average (pandas ignore_na=False)
+        old_wt *= 1.0 - alpha
+        if cur == cur:
+            if weighted != cur:
+                weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+            old_wt = 1.0
+    elif cur == cur:
+        weighted = cur
+    return weighted, old_wt
+
+@njit(cache=True, nogil=True, error_model="numpy")
+def compute_indicators(close):
+    """
+    Calculate ema_7, vwma_17, ema_12, ema_26, macd_line, macd_signal, roc_8 in a single pass over close.
+    Matches pandas ewm(span, adjust=False).mean() and pct_change(8).
+    """
+    n = len(close)
+    ema_7 = np.empty(n)
+    vwma_17 = np.empty(n)
+    ema_12 = np.empty(n)
+    ema_26 = np.empty(n)
+    macd_line = np.empty(n)
+    macd_signal = np.empty(n)
+    roc_8 = np.empty(n)
+    if n == 0:
+        return ema_7, vwma_17, ema_12, ema_26, macd_line, macd_signal, roc_8
+
+    # Every average is seeded with the first value
+    e7, e17, e12, e26 = close[0], close[0], close[0], close[0]
+    w7, w17, w12, w26, w9 = 1.0, 1.0, 1.0, 1.0, 1.0
+    sig = e12 - e26
+
+    for i in range(n):
+        cur = close[i]
+        if i > 0:
+            e7, w7 = ewma_step(e7, w7, cur, ALPHA_7)
+            e17, w17 = ewma_step(e17, w17, cur, ALPHA_17)
+            e12, w12 = ewma_step(e12, w12, cur, ALPHA_12)
+            e26, w26 = ewma_step(e26, w26, cur, ALPHA_26)
+            sig, w9 = ewma_step(sig, w9, e12 - e26, ALPHA_9)
+        ema_7[i] = e7
+        vwma_17[i] = e17
+        ema_12[i] = e12
+        ema_26[i] = e26
+        macd_line[i] = e12 - e26
+        macd_signal[i] = sig
+        roc_8[i] = close[i] / close[i - 8] - 1.0 if i >= 8 else np.nan
+
+    return ema_7, vwma_17, ema_12, ema_26, macd_line, macd_signal, roc_8
+
+@njit(cache=True, nogil=True)
+def run_strategy(close, ema_7, vwma_17, macd_line, macd_signal, roc_8, is_open, open_price):
+    """
+    Walk every bar once and return the trades as (entry_idx, entry_price, exit_idx, exit_price, profit_loss),
+    a trade still open at the end has exit_idx -1 (a bar is checked for entry before exit)
+    """
+    n = len(close)
+    entry_idx = np.full(n + 1, -1, np.int64)
+    exit_idx = np.full(n + 1, -1, np.int64)
+    entry_price = np.empty(n + 1)
+    exit_price = np.full(n + 1, np.nan)
+    profit_loss = np.full(n + 1, np.nan)
+    count = 0
+
+    # A position carried in from an earlier backtest has no entry bar in this run
+    if is_open:
+        entry_price[0] = open_price
+        count = 1
+
+    for i in range(n):
+        # Entry when ema_7 > vwma_17, roc_8 > 0 and macd_line > macd_signal
+        if not is_open and ema_7[i] > vwma_17[i] and roc_8[i] > 0 and macd_line[i] > macd_signal[i]:
+            is_open = True
+            entry_idx[count] = i
+            entry_price[count] = close[i]
+            count += 1
+
+        # Exit when at least 2 out of 3 of EMA(7) < VWMA(17), ROC(8) < 0, MACD Line < MACD Signal
+        if is_open:
+            votes = int(ema_7[i] < vwma_17[i]) + int(roc_8[i] < 0) + int(macd_line[i] < macd_signal[i])
+            if votes >= 2:
+                is_open = False
+                exit_idx[count - 1] = i
+                exit_price[count - 1] = close[i]
+                profit_loss[count - 1] = close[i] - entry_price[count - 1]
+
+    return (entry_idx[:count], entry_price[:count], exit_idx[:count],
+            exit_price[:count], profit_loss[:count])
+
 class OptionsTracker:
     def __init__(self):
         """
@@ -15,14 +131,30 @@ class OptionsTracker:
 
         # Create data directory if it doesn't exist
         os.makedirs("data", exist_ok=True)
+        os.makedirs("data/cache", exist_ok=True)
+
+        # Worker pool for per-symbol work (the four option symbols are independent)
+        max_workers = 4
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
 
         # Initialize the client
         self.client = RESTClient(os.getenv("POLYGON_API_KEY"))
+        # urllib3 keeps one idle connection per host by default; keep one per worker so
+        # concurrent fetches reuse their keep-alive TLS connections instead of reconnecting.
+        # The SDK has no public way to set the pool size, so only resize its PoolManager if it is still there
+        pool_manager = getattr(self.client, "client", None)
+        if isinstance(pool_manager, urllib3.PoolManager):
+            pool_manager.connection_pool_kw["maxsize"] = max_workers
+        # Guards state shared between symbols (self.trades); self.entries is only touched per symbol
+        self._lock = threading.Lock()
 
         # For each time frame and each option symbol, trade status starts off False, entry price starts off 0, exit price starts off 0
         self.time_frames = ["1min", "5min", "10min"]
         self.entries = {}
         self.trades = []
+
+        # In-memory OHLCV frames per option symbol and time frame, built once per run
+        self.frames = {}
     
 
     
@@ -56,184 +188,213 @@ class OptionsTracker:
     def fetch_ohlcv(self, option_symbol, start_date, end_date):
         """
         Fetch 1 minute ohlcv for the option symbol between start and end dates.
+        Returns the fetched bars as a DataFrame (also kept in self.frames), or None if nothing was fetched.
+        YYYY-MM-DD ranges that ended before today (US/Eastern) are cached in data/cache/ and reused on later runs.
         """
-        csv_filename = f"data/{option_symbol}_1min.csv"
+        # Only YYYY-MM-DD ranges are cached; list_aggs also takes dates, datetimes and ms timestamps
+        try:
+            last_day = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            last_day = None
+        cache_filename = f"data/cache/{option_symbol}_{start_date}_{end_date}.csv" if last_day else None
+        
+        # Bars for a range that has already closed never change, so a cached copy is as good as a fetch
+        if cache_filename and os.path.exists(cache_filename):
+            df = pd.read_csv(cache_filename, float_precision="round_trip")
+            self.frames[option_symbol] = {"1min": df}
+            print(f"📦 Loaded {len(df)} cached OHLCV records for {option_symbol}")
+            return df
         
-        # Always fetch fresh data for backtesting
         print(f"📥 Fetching OHLCV data for {option_symbol} from {start_date} to {end_date}")
         
-        # Fetch data from API for the date range
-        aggs = []
+        # Fetch data from API for the date range, collected straight into row tuples
         try:
-            for a in self.client.list_aggs(
-                f"O:{option_symbol}",
-                1,
-                "minute",
-                start_date,
-                end_date,
-                adjusted="true",
-                sort="asc",
-                limit=50000,
-            ):
-                aggs.append(a)
+            rows = [
+                (a.timestamp, a.open, a.high, a.low, a.close, a.volume)
+                for a in self.client.list_aggs(
+                    f"O:{option_symbol}",
+                    1,
+                    "minute",
+                    start_date,
+                    end_date,
+                    adjusted="true",
+                    sort="asc",
+                    limit=50000,
+                )
+            ]
         except Exception as e:
             print(f"❌ Error fetching data for {option_symbol}: {e}")
             return
         
-        if not aggs:
+        if not rows:
             print(f"⚠️  No data available for {option_symbol} from {start_date} to {end_date}")
             return
             
-        # Save to csv (overwrite existing data)
-        with open(csv_filename, 'w') as f:
-            # Write header
-            f.write("timestamp,open,high,low,close,volume\n")
-            
-            # Write all fetched data (no rounding)
-            for agg in aggs:
-                f.write(f"{agg.timestamp},{agg.open},{agg.high},{agg.low},{agg.close},{agg.volume}\n")
+        # Keep in memory (no rounding); calculate_indicators persists the 1min csv once at the end
+        df = pd.DataFrame(rows, columns=["timestamp", "open", "high", "low", "close", "volume"])
+        self.frames[option_symbol] = {"1min": df}
+        
+        # Don't cache a range that includes today, its bars are still forming. Polygon's dates are
+        # US/Eastern, so compare against the ET date rather than the local one; a range ending
+        # before today ET closed at 16:15 ET at least 7h45m ago
+        if last_day and last_day < datetime.now(ZoneInfo("America/New_York")).date():
+            # Write to a temporary file first so an interrupted run never leaves a partial cache
+            df.to_csv(f"{cache_filename}.tmp", index=False)
+            os.replace(f"{cache_filename}.tmp", cache_filename)
         
-        print(f"✅ Saved {len(aggs)} OHLCV records for {option_symbol}")
+        print(f"✅ Fetched {len(rows)} OHLCV records for {option_symbol}")
+        return df
 
-    def aggregate_minute_data(self, option_symbol):
-        # Read csv
-        df = pd.read_csv(f"data/{option_symbol}_1min.csv")
+    def save_trades(self, trades):
+        """
+        Append completed trades to their per symbol/timeframe entry_exit csv, one write per file
+        """
+        if not trades:
+            return
+        for (option_symbol, time_frame), group in pd.DataFrame(trades).groupby(["option_symbol", "time_frame"]):
+            group.to_csv(f"data/{option_symbol}_{time_frame}_entry_exit.csv", mode="a", header=False, index=False)
+
+    def resample_ohlcv(self, df, minutes):
+        """
+        Aggregate OHLCV bars (timestamp in epoch ms) into candles of the given number of minutes.
+        Equivalent to resample(...).agg(first/max/min/last/sum).dropna() on a datetime index.
+        """
+        # Bars must be in time order for each bucket to be one contiguous run
+        if not df["timestamp"].is_monotonic_increasing:
+            df = df.sort_values("timestamp", kind="stable")
         
-        # Convert timestamp from milliseconds to datetime
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
+        # Bucket id per bar (epoch ms buckets line up with pandas' midnight origin); empty buckets never appear
+        bucket_ms = minutes * 60_000
+        bucket = df["timestamp"].to_numpy() // bucket_ms
+        starts = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+        ends = np.append(starts[1:], len(bucket)) - 1
+        
+        return pd.DataFrame({
+            "timestamp": bucket[starts] * bucket_ms,
+            "open": df["open"].to_numpy()[starts],
+            "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+            "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+            "close": df["close"].to_numpy()[ends],
+            "volume": np.add.reduceat(df["volume"].to_numpy(), starts)
+        })
+
+    def aggregate_minute_data(self, option_symbol):
+        if option_symbol not in self.frames:
+            return
+
+        # 1min bars as fetched by fetch_ohlcv
+        df_1min = self.frames[option_symbol]["1min"]
         
         # Remove rows with NaN values (in case resampling creates empty periods)
-        df = df.dropna()
+        df = df_1min.dropna()
         
         if len(df) == 0:
             print(f"⚠️  No valid data to aggregate for {option_symbol}")
             return
         
         # Aggregate to 5 minutes
-        df_5min = df.resample('5min').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).dropna()  # Remove empty periods
+        df_5min = self.resample_ohlcv(df, 5)
+        
+        # Aggregate 10 minutes from the 5 minute candles (10min buckets are exact pairs of 5min buckets)
+        df_10min = self.resample_ohlcv(df_5min, 10)
         
-        # Aggregate 10 minutes  
-        df_10min = df.resample('10min').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).dropna()  # Remove empty periods
+        # Convert timestamp from milliseconds to datetime
+        df_5min['timestamp'] = pd.to_datetime(df_5min['timestamp'], unit='ms')
+        df_10min['timestamp'] = pd.to_datetime(df_10min['timestamp'], unit='ms')
         
-        # Save to csv
-        df_5min.to_csv(f"data/{option_symbol}_5min.csv")
-        df_10min.to_csv(f"data/{option_symbol}_10min.csv")
+        # Keep the frames in memory; calculate_indicators writes each csv once
+        self.frames[option_symbol]["5min"] = df_5min
+        self.frames[option_symbol]["10min"] = df_10min
         
         print(f"📊 Aggregated {len(df)} 1min → {len(df_5min)} 5min → {len(df_10min)} 10min candles for {option_symbol}")
 
-    def calculate_indicators(self, option_symbol, time_frame):
+    def calculate_indicators(self, option_symbol):
         """
-        Calculate ema_7, vwma_17, ema_12, ema_26, macd_line, macd_signal, roc_8 for new entries
+        Calculate ema_7, vwma_17, ema_12, ema_26, macd_line, macd_signal, roc_8 for every timeframe of the option symbol
+        """
+        # All three timeframes are already in memory from the fetched 1min bars
+        for time_frame, df in self.frames[option_symbol].items():
+            close = df["close"].to_numpy(dtype=np.float64)
+
+            # Calculate ema_7, vwma_17,ema_7,vwma_17,ema_12,ema_26,macd_line,macd_signal,roc_8 for new entries
+            (df["ema_7"], df["vwma_17"], df["ema_12"], df["ema_26"],
+             df["macd_line"], df["macd_signal"], df["roc_8"]) = compute_indicators(close)
+
+        # Save each timeframe to csv
+        for time_frame, df in self.frames[option_symbol].items():
+            df.to_csv(f"data/{option_symbol}_{time_frame}.csv", index=False)
+
+
+    def backtest(self, option_symbol):
+        """
+        Walk every bar of each timeframe in order, entering and exiting positions on the strategy signals
         """
-        # Read csv
-        df = pd.read_csv(f"data/{option_symbol}_{time_frame}.csv")
-    
-        # Calculate ema_7, vwma_17,ema_7,vwma_17,ema_12,ema_26,macd_line,macd_signal,roc_8 for new entries
-        df["ema_7"] = df["close"].ewm(span=7, adjust=False).mean()
-        df["vwma_17"] = df["close"].ewm(span=17, adjust=False).mean()
-        df["ema_12"] = df["close"].ewm(span=12, adjust=False).mean()
-        df["ema_26"] = df["close"].ewm(span=26, adjust=False).mean()
-        df["macd_line"] = df["ema_12"] - df["ema_26"]
-        df["macd_signal"] = df["macd_line"].ewm(span=9, adjust=False).mean()
-        df["roc_8"] = df["close"].pct_change(8)
-        # Save to csv
-        df.to_csv(f"data/{option_symbol}_{time_frame}.csv", index=False)
-
-
-    def check_for_entry(self, option_symbol):
-        for time_frame in self.time_frames: 
-            # Read csv
-            df = pd.read_csv(f"data/{option_symbol}_{time_frame}.csv")
-            # Check if ema_7 is greater than vwma_17 and roc_8 is greater than 0
-            if (df["ema_7"].iloc[-1] > df["vwma_17"].iloc[-1] and 
-                df["roc_8"].iloc[-1] > 0 and 
-                df["macd_line"].iloc[-1] > df["macd_signal"].iloc[-1] and 
-                not self.entries[option_symbol][time_frame]["open"]):
-                
-                # Record the entry
-                self.entries[option_symbol][time_frame]["open"] = True
-                # Record the entry price
-                entry_price = df["close"].iloc[-1]
-                self.entries[option_symbol][time_frame]["entry_price"] = entry_price
-                
-                print(f"✅ ENTRY: {option_symbol} ({time_frame}) at ${entry_price:.4f}")
-            
-            
-    def check_for_exit(self, option_symbol):
         for time_frame in self.time_frames:
-            # Read csv
-            df = pd.read_csv(f"data/{option_symbol}_{time_frame}.csv")
-            
-            # Check individual exit conditions
-            condition1 = df["ema_7"].iloc[-1] < df["vwma_17"].iloc[-1]  # EMA(7) < VWMA(17)
-            condition2 = df["roc_8"].iloc[-1] < 0                      # ROC(8) < 0
-            condition3 = df["macd_line"].iloc[-1] < df["macd_signal"].iloc[-1]  # MACD Line < MACD Signal
-            
-            # Count how many conditions are true
-            exit_conditions_met = sum([condition1, condition2, condition3])
-            
-            # Exit if at least 2 out of 3 conditions are true AND we have an open position
-            if exit_conditions_met >= 2 and self.entries[option_symbol][time_frame]["open"]:
-                # Record the exit
-                self.entries[option_symbol][time_frame]["open"] = False
-                
-                # Calculate profit/loss
-                entry_price = self.entries[option_symbol][time_frame]["entry_price"]
-                exit_price = df["close"].iloc[-1]
-                profit_loss = exit_price - entry_price
-                
+            df = self.frames[option_symbol][time_frame]
+            position = self.entries[option_symbol][time_frame]
+
+            # The whole entry/exit state machine runs compiled over the indicator arrays
+            entry_idx, entry_price, exit_idx, exit_price, profit_loss = run_strategy(
+                df["close"].to_numpy(dtype=np.float64),
+                df["ema_7"].to_numpy(), df["vwma_17"].to_numpy(),
+                df["macd_line"].to_numpy(), df["macd_signal"].to_numpy(),
+                df["roc_8"].to_numpy(),
+                position["open"], float(position["entry_price"]))
+
+            trades = []
+            for k in range(len(entry_idx)):
+                if entry_idx[k] >= 0:
+                    # Record the entry
+                    print(f"✅ ENTRY: {option_symbol} ({time_frame}) at ${float(entry_price[k]):.4f}")
+
+                if exit_idx[k] < 0:
+                    continue
+
                 # Record the trade entry, exit, and profit/loss
-                self.trades.append({
+                trades.append({
                     "option_symbol": option_symbol,
                     "time_frame": time_frame,
-                    "entry_price": entry_price,
-                    "exit_price": exit_price,
-                    "profit_loss": profit_loss
+                    "entry_price": float(entry_price[k]),
+                    "exit_price": float(exit_price[k]),
+                    "profit_loss": float(profit_loss[k])
                 })
 
-                # Store the entry and exit in a csv file with profit/loss
-                with open(f"data/{option_symbol}_{time_frame}_entry_exit.csv", "a") as f:
-                    f.write(f"{option_symbol},{time_frame},{entry_price},{exit_price},{profit_loss}\n")
+                pnl_status = "PROFIT" if profit_loss[k] >= 0 else "LOSS"
+                print(f"🔚 EXIT: {option_symbol} ({time_frame}) at ${float(exit_price[k]):.4f} - {pnl_status}: ${float(profit_loss[k]):.4f}")
 
-                pnl_status = "PROFIT" if profit_loss >= 0 else "LOSS"
-                print(f"🔚 EXIT: {option_symbol} ({time_frame}) at ${exit_price:.4f} - {pnl_status}: ${profit_loss:.4f}")
+            # The last trade is still open if it has no exit bar
+            if len(entry_idx):
+                position["open"] = bool(exit_idx[-1] < 0)
+                position["entry_price"] = float(entry_price[-1])
 
-        
-    def process_data(self, option_symbols):
+            with self._lock:
+                self.trades.extend(trades)
+
+    def process_symbol(self, option_symbol):
         """
-        Process data (aggregate, calculate indicators, check entry/exit)
+        Process one option symbol (aggregate, calculate indicators, backtest entries/exits)
         """
-        print(f"⚙️  Starting data processing at {datetime.now().strftime('%H:%M:%S')}")
-        
         # Aggregate minute data to create 5min and 10min timeframes
-        for symbol in option_symbols:
-            self.aggregate_minute_data(symbol)
+        self.aggregate_minute_data(option_symbol)
 
-        # Calculate indicators for each timeframe
-        for time_frame in self.time_frames:
-            for symbol in option_symbols:
-                self.calculate_indicators(symbol, time_frame)
+        # Only symbols with data for every timeframe go through the remaining stages
+        if len(self.frames.get(option_symbol, {})) != len(self.time_frames):
+            return
 
-        # Check for entry
-        for symbol in option_symbols:
-            self.check_for_entry(symbol)
+        # Calculate indicators for all timeframes
+        self.calculate_indicators(option_symbol)
 
-        # Check for exit
-        for symbol in option_symbols:
-            self.check_for_exit(symbol)
+        # Simulate entries and exits over every bar (only this symbol's self.entries are touched)
+        self.backtest(option_symbol)
+
+    def process_data(self, option_symbols):
+        """
+        Process data (aggregate, calculate indicators, backtest entries/exits)
+        """
+        print(f"⚙️  Starting data processing at {datetime.now().strftime('%H:%M:%S')}")
+        
+        # Each symbol runs its whole pipeline on a worker; symbols don't wait on each other between stages
+        list(self._pool.map(self.process_symbol, option_symbols))
             
         print(f"✅ Data processing completed at {datetime.now().strftime('%H:%M:%S')}")
 
@@ -360,20 +521,34 @@ class OptionsTracker:
 
         # Fetch data for all symbols using the date range
         print(f"📥 Fetching data from {start_date} to {end_date}")
-        for symbol in option_symbols:
-            self.fetch_ohlcv(symbol, start_date, end_date)
+        self.frames = {}
+        list(self._pool.map(lambda symbol: self.fetch_ohlcv(symbol, start_date, end_date), option_symbols))
             
         # Process data
         print(f"⚙️  Processing data")
-        self.process_data(option_symbols)
+        first_new_trade = len(self.trades)
+        try:
+            self.process_data(option_symbols)
+        finally:
+            # Store this run's entries and exits in the csv files with profit/loss
+            self.save_trades(self.trades[first_new_trade:])
         print(f"✅ Backtesting completed")
         
         # Show results
         self.show_results()
 
+    def close(self):
+        """
+        Shut down the worker pool; call once the tracker is no longer needed
+        """
+        self._pool.shutdown(wait=True)
+
 
 
 
 if __name__ == "__main__":
     tracker = OptionsTracker()
-    tracker.run()
+    try:
+        tracker.run()
+    finally:
+        tracker.close()